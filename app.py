@@ -1,6 +1,9 @@
 import streamlit as st
 import google.generativeai as genai
 import os
+import string
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 
 # --- Configuration and API Key Handling ---
 try:
@@ -14,67 +17,146 @@ except (KeyError, FileNotFoundError):
         st.error("🔴 Google API Key not found. Please set it in `secrets.toml` for deployment or as an environment variable for local development.")
         st.stop()
 
-genai.configure(api_key=GOOGLE_API_KEY)
+@st.cache_resource
+def configure_genai(api_key):
+    """Configures the Gemini client once per process."""
+    genai.configure(api_key=api_key)
+
+configure_genai(GOOGLE_API_KEY)
+
+# Interview system prompt, filled in from the setup form
+_SYS_TMPL = string.Template(
+    "You are an HR executive named Amanda, conducting an interview. Your candidate, $name, "
+    "has $experience of experience and possesses skills in $skills. "
+    "You are interviewing them for the $level $position position at $company. "
+    "Please ask relevant questions to assess their fit for the role and company culture. Start by introducing yourself and asking the first question."
+)
+
+# Generation limits for interview turns and for the feedback summary
+INTERVIEW_GENERATION_CONFIG = genai.types.GenerationConfig(max_output_tokens=250, temperature=0.7)
+FEEDBACK_GENERATION_CONFIG = genai.types.GenerationConfig(max_output_tokens=400, temperature=0.3)
+
+# Opening user message that asks the model to follow the system prompt
+BOOTSTRAP = "Please act as described in the following instructions and start the interview."
+
+# Maps chat history roles to Gemini API roles
+ROLE_MAP = {"user": "user", "assistant": "model"}
 
 
 # --- assistant and Session State Initialization ---
+_DEFAULTS = {
+    "roles": [], # Interview chat history: message roles...
+    "contents": [], # ...and the matching message texts
+    "user_turns": 0, # Number of user answers in the interview
+    "history_md": "", # Finished interview turns rendered as markdown
+    "setup_complete": False,
+    "chat_complete": False,
+    "feedback_phase": False, # New state to control feedback section visibility
+    "feedback_messages": [], # Stores feedback chat history
+    "feedback_generated": False, # New state to prevent regenerating feedback
+    "feedback_future": None, # Pending background feedback generation
+    "name": "",
+    "experience": "",
+    "skills": "",
+    "level": "Junior",
+    "position": "Software Engineer",
+    "company": "Google"
+}
+
 def initialize_session_state():
     """Initializes all necessary keys in Streamlit's session state."""
-    defaults = {
-        "messages": [], # Stores interview chat history
-        "setup_complete": False,
-        "chat_complete": False,
-        "feedback_phase": False, # New state to control feedback section visibility
-        "feedback_messages": [], # Stores feedback chat history
-        "feedback_generated": False, # New state to prevent regenerating feedback
-        "name": "",
-        "experience": "",
-        "skills": "",
-        "level": "Junior",
-        "position": "Software Engineer",
-        "company": "Google"
-    }
-    for key, value in defaults.items():
-        if key not in st.session_state:
-            st.session_state[key] = value
+    for key, value in _DEFAULTS.items():
+        st.session_state.setdefault(key, value)
 
 initialize_session_state()
 
+@st.cache_resource
 def get_generative_model():
     """Creates and caches the generative model instance."""
     return genai.GenerativeModel("gemini-1.5-flash-latest")
 
+def start_chat_session(api_prefix, roles, contents):
+    """Starts a Gemini chat session seeded with the prebuilt prefix and the given interview history."""
+    history = api_prefix + [{"role": ROLE_MAP[role], "parts": [content]} for role, content in zip(roles, contents)]
+    return get_generative_model().start_chat(history=history)
+
+@st.cache_resource
+def get_feedback_executor():
+    """Creates the thread pool shared by all sessions for feedback generation."""
+    return ThreadPoolExecutor(max_workers=8)
+
+def run_feedback(model, prompt):
+    """Generates interview feedback text. Runs off the script thread, so it must not call Streamlit."""
+    # The feedback is short and structured, so fetch it in one non-streaming call
+    response = model.generate_content(
+        [{"role": "user", "parts": [prompt]}],
+        generation_config=FEEDBACK_GENERATION_CONFIG
+    )
+    return response.text
+
+def format_message_md(role, content):
+    """Formats a finished chat message as a markdown paragraph for the history block."""
+    return f"**{role.capitalize()}:** {content}\n\n"
+
+def coalesce_chunks(response_generator):
+    """Merges streamed chunk texts into larger deltas so st.write_stream redraws less often."""
+    pending = ""
+    last_flush = time.monotonic()
+    for chunk in response_generator:
+        if chunk.text:
+            pending += chunk.text
+            # Hold back deltas that are only whitespace or punctuation
+            if not pending.strip(string.whitespace + string.punctuation):
+                continue
+            # Yield at most every 50ms or 64 characters to avoid a redraw per chunk
+            if time.monotonic() - last_flush > 0.05 or len(pending) > 64:
+                yield pending
+                pending = ""
+                last_flush = time.monotonic()
+    if pending:
+        yield pending
+
 # --- Setup Phase UI ---
 if not st.session_state.setup_complete and not st.session_state.feedback_phase:
     st.title("Interview Chatbot Setup")
 
-    st.subheader('Personal Information', divider='rainbow')
-    st.session_state.name = st.text_input("Name", value=st.session_state.name, placeholder="e.g., Jane Doe")
-    st.session_state.experience = st.text_input("Years of Experience", value=st.session_state.experience, placeholder="e.g., 5 years")
-    st.session_state.skills = st.text_input("Key Skills", value=st.session_state.skills, placeholder="e.g., Python, SQL, Project Management")
+    # Batch the setup widgets in a form so editing them does not rerun the script
+    with st.form("setup_form"):
+        st.subheader('Personal Information', divider='rainbow')
+        st.session_state.name = st.text_input("Name", value=st.session_state.name, placeholder="e.g., Jane Doe")
+        st.session_state.experience = st.text_input("Years of Experience", value=st.session_state.experience, placeholder="e.g., 5 years")
+        st.session_state.skills = st.text_input("Key Skills", value=st.session_state.skills, placeholder="e.g., Python, SQL, Project Management")
 
-    st.subheader('Role and Company', divider='rainbow')
-    col1, col2 = st.columns(2)
-    with col1:
-        st.session_state.level = st.radio('Choose your level', ['Junior', 'Mid-level', 'Senior'], index=0)
-    with col2:
-        st.session_state.position = st.selectbox('Choose your position', ('Software Engineer', 'Data Scientist', 'Product Manager', 'UX Designer'))
-    st.session_state.company = st.selectbox('Choose your company', ('Google', 'Microsoft', 'Amazon', 'Meta', 'Apple', 'Tesla'))
+        st.subheader('Role and Company', divider='rainbow')
+        col1, col2 = st.columns(2)
+        with col1:
+            st.session_state.level = st.radio('Choose your level', ['Junior', 'Mid-level', 'Senior'], index=0)
+        with col2:
+            st.session_state.position = st.selectbox('Choose your position', ('Software Engineer', 'Data Scientist', 'Product Manager', 'UX Designer'))
+        st.session_state.company = st.selectbox('Choose your company', ('Google', 'Microsoft', 'Amazon', 'Meta', 'Apple', 'Tesla'))
+
+        st.markdown("---")
+        submitted = st.form_submit_button("Start Interview", type="primary")
 
-    st.markdown("---")
-    
     required_fields = [st.session_state.name, st.session_state.experience, st.session_state.skills]
-    if st.button("Start Interview", type="primary"):
+    if submitted:
         if all(required_fields):
             st.session_state.setup_complete = True
             # Build and store the initial system prompt for the interview
-            system_prompt = (
-                f"You are an HR executive named Amanda, conducting an interview. Your candidate, {st.session_state.name}, "
-                f"has {st.session_state.experience} of experience and possesses skills in {st.session_state.skills}. "
-                f"You are interviewing them for the {st.session_state.level} {st.session_state.position} position at {st.session_state.company}. "
-                "Please ask relevant questions to assess their fit for the role and company culture. Start by introducing yourself and asking the first question."
+            system_prompt = _SYS_TMPL.substitute(
+                name=st.session_state.name,
+                experience=st.session_state.experience,
+                skills=st.session_state.skills,
+                level=st.session_state.level,
+                position=st.session_state.position,
+                company=st.session_state.company,
             )
-            st.session_state.messages.append({"role": "system", "content": system_prompt})
+            # Send the system prompt as a user/model exchange ahead of the history; it is the only copy kept
+            st.session_state.api_prefix = [
+                {"role": "user", "parts": [BOOTSTRAP]},
+                {"role": "model", "parts": [system_prompt]},
+            ]
+            st.session_state.chat = start_chat_session(st.session_state.api_prefix, st.session_state.roles, st.session_state.contents)
             st.rerun()
         else:
             st.error("🔴 Please fill in all personal information fields.")
@@ -83,28 +165,23 @@ if not st.session_state.setup_complete and not st.session_state.feedback_phase:
 elif not st.session_state.chat_complete and not st.session_state.feedback_phase:
     st.title(f"Interview with {st.session_state.company}")
 
-    # Display chat history (skip system message)
-    for i, msg in enumerate(st.session_state.messages):
-        if msg["role"] == "system":
-            continue
-        with st.chat_message(msg["role"]):
-            st.markdown(msg["content"])
-    
-    # Count user messages to limit turns
-    user_message_count = sum(1 for m in st.session_state.messages if m["role"] == "user")
-    
-    # Check if chat should be completed
-    if user_message_count >= 5:
-        st.session_state.chat_complete = True
-        st.rerun()
+    # The chat session lives only in memory, so rebuild it if it was lost
+    if "chat" not in st.session_state:
+        st.session_state.chat = start_chat_session(st.session_state.api_prefix, st.session_state.roles, st.session_state.contents)
 
-    # Chat input
-    prompt = st.chat_input(f"Your response ({5 - user_message_count} remaining)...")
+    # Display finished turns as one markdown block; only the new turn gets chat bubbles
+    if st.session_state.history_md:
+        st.markdown(st.session_state.history_md)
+    
+    # Read the submitted answer before drawing the chat input so its remaining count covers this turn
+    prompt = st.session_state.get("interview_input")
 
     # Process the prompt
     if prompt:
         # First, add user message to session state immediately
-        st.session_state.messages.append({"role": "user", "content": prompt})
+        st.session_state.roles.append("user")
+        st.session_state.contents.append(prompt)
+        st.session_state.user_turns += 1
         
         # Display user message
         with st.chat_message("user"):
@@ -113,49 +190,45 @@ elif not st.session_state.chat_complete and not st.session_state.feedback_phase:
         # Generate and display assistant response
         try:
             with st.chat_message("assistant"):
-                message_placeholder = st.empty()
                 with st.spinner("Thinking..."):
-                    model = get_generative_model()
-                    
-                    # Prepare messages for the Gemini API
-                    api_messages = []
-                    for m in st.session_state.messages:
-                        if m["role"] == "system":
-                            # Convert system message to assistant message for Gemini
-                            api_messages.append({"role": "user", "parts": ["Please act as described in the following instructions and start the interview."]})
-                            api_messages.append({"role": "model", "parts": [m["content"]]})
-                        elif m["role"] == "user":
-                            api_messages.append({"role": "user", "parts": [m["content"]]})
-                        elif m["role"] == "assistant":
-                            api_messages.append({"role": "model", "parts": [m["content"]]})
-                    
-                    full_response = ""
-                    response_generator = model.generate_content(api_messages, stream=True)
+                    response_generator = st.session_state.chat.send_message(
+                        prompt, stream=True, generation_config=INTERVIEW_GENERATION_CONFIG
+                    )
                     
                     # Stream the response
-                    for chunk in response_generator:
-                        if chunk.text:
-                            full_response += chunk.text
-                            message_placeholder.markdown(full_response + "▌")
-                    
-                    # Display final response
-                    message_placeholder.markdown(full_response)
+                    full_response = st.write_stream(coalesce_chunks(response_generator))
 
             # Add assistant response to session state
             if full_response:
-                st.session_state.messages.append({"role": "assistant", "content": full_response})
-                st.rerun()  # Rerun to update the display
+                st.session_state.roles.append("assistant")
+                st.session_state.contents.append(full_response)
+                st.session_state.history_md += format_message_md("user", prompt) + format_message_md("assistant", full_response)
             else:
                 st.error("🔴 The model did not provide a response. Please try again.")
                 # Remove the user message if no response was generated
-                if st.session_state.messages and st.session_state.messages[-1]["role"] == "user":
-                    st.session_state.messages.pop()
+                if st.session_state.roles and st.session_state.roles[-1] == "user":
+                    st.session_state.roles.pop()
+                    st.session_state.contents.pop()
+                    st.session_state.user_turns -= 1
+                st.session_state.chat = start_chat_session(st.session_state.api_prefix, st.session_state.roles, st.session_state.contents)
 
         except Exception as e:
             st.error(f"🔴 An error occurred while generating the response: {e}")
             # Remove the user message if API call failed
-            if st.session_state.messages and st.session_state.messages[-1]["role"] == "user":
-                st.session_state.messages.pop()
+            if st.session_state.roles and st.session_state.roles[-1] == "user":
+                st.session_state.roles.pop()
+                st.session_state.contents.pop()
+                st.session_state.user_turns -= 1
+            # Resync the chat session, which may hold the failed exchange
+            st.session_state.chat = start_chat_session(st.session_state.api_prefix, st.session_state.roles, st.session_state.contents)
+
+    # Move on to the completion phase once the last answer is in
+    if st.session_state.user_turns >= 5:
+        st.session_state.chat_complete = True
+        st.rerun()
+
+    # Chat input
+    st.chat_input(f"Your response ({5 - st.session_state.user_turns} remaining)...", key="interview_input")
 
 # --- Completion Phase UI (Interview Done) ---
 elif st.session_state.chat_complete and not st.session_state.feedback_phase:
@@ -164,50 +237,58 @@ elif st.session_state.chat_complete and not st.session_state.feedback_phase:
     if st.button("Get Feedback", type="primary"):
         st.session_state.feedback_phase = True
         st.session_state.feedback_generated = False
+        st.session_state.feedback_future = None
         st.rerun()
 
 # --- Feedback Phase UI ---
 elif st.session_state.feedback_phase:
     st.title("Interview Feedback")
 
-    if not st.session_state.feedback_generated:
-        with st.spinner("Generating feedback..."):
-            feedback_model = get_generative_model()
-
-            # Construct the prompt for the feedback model
-            feedback_system_prompt = (
-                "You are an interview feedback bot. Your task is to analyze the provided interview conversation, "
-                "rate the candidate's performance from 1 to 10, identify specific areas for improvement, and offer actionable tips. "
-                "Present your feedback clearly and concisely. Do not act as the HR executive 'Amanda' anymore. "
-                "The format should be: \n\n"
-                "**Overall Rating:** [X/10]\n\n"
-                "**Areas for Improvement:**\n- [Point 1]\n- [Point 2]\n\n"
-                "**Tips for Future Interviews:**\n- [Tip 1]\n- [Tip 2]"
-            )
+    # Draw the Restart button before waiting on feedback so it stays clickable; feedback fills the area above it
+    feedback_area = st.container()
 
-            # Convert interview history to a readable string for the feedback model
-            interview_history_text = "\n".join([
-                f"{msg['role'].capitalize()}: {msg['content']}" 
-                for msg in st.session_state.messages 
-                if msg['role'] != 'system'
-            ])
+    st.markdown("---")
+    if st.button("Restart Interview", type="secondary"):
+        st.session_state.clear()
+        st.rerun()
 
-            # Combine system prompt and interview history
-            full_feedback_prompt = f"{feedback_system_prompt}\n\n--- Interview Transcript ---\n{interview_history_text}"
-            
-            try:
-                feedback_response_generator = feedback_model.generate_content(
-                    [{"role": "user", "parts": [full_feedback_prompt]}],
-                    stream=True
+    with feedback_area:
+        if not st.session_state.feedback_generated:
+            if st.session_state.feedback_future is None:
+                # Construct the prompt for the feedback model
+                feedback_system_prompt = (
+                    "You are an interview feedback bot. Your task is to analyze the provided interview conversation, "
+                    "rate the candidate's performance from 1 to 10, identify specific areas for improvement, and offer actionable tips. "
+                    "Present your feedback clearly and concisely. Do not act as the HR executive 'Amanda' anymore. "
+                    "The format should be: \n\n"
+                    "**Overall Rating:** [X/10]\n\n"
+                    "**Areas for Improvement:**\n- [Point 1]\n- [Point 2]\n\n"
+                    "**Tips for Future Interviews:**\n- [Tip 1]\n- [Tip 2]"
                 )
 
-                feedback_text = ""
-                feedback_placeholder = st.empty()
-                for chunk in feedback_response_generator:
-                    if chunk.text:
-                        feedback_text += chunk.text
-                        feedback_placeholder.markdown(feedback_text + "▌")
-                feedback_placeholder.markdown(feedback_text)
+                # Convert interview history to a readable string for the feedback model
+                interview_history_text = "\n".join([
+                    f"{role.capitalize()}: {content}" 
+                    for role, content in zip(st.session_state.roles, st.session_state.contents) 
+                ])
+
+                # Combine system prompt and interview history
+                full_feedback_prompt = f"{feedback_system_prompt}\n\n--- Interview Transcript ---\n{interview_history_text}"
+
+                # Submit once; the future survives timeout reruns in session state
+                st.session_state.feedback_future = get_feedback_executor().submit(
+                    run_feedback, get_generative_model(), full_feedback_prompt
+                )
+
+            # Wait for the feedback in this run; rerun only on timeout so a pending Restart click is picked up
+            with st.spinner("Generating feedback..."):
+                wait([st.session_state.feedback_future], timeout=5)
+            if not st.session_state.feedback_future.done():
+                st.rerun()
+
+            try:
+                feedback_text = st.session_state.feedback_future.result()
+                st.markdown(feedback_text)
 
                 st.session_state.feedback_messages.append({"role": "assistant", "content": feedback_text})
                 st.session_state.feedback_generated = True
@@ -216,13 +297,8 @@ elif st.session_state.feedback_phase:
                 st.error(f"🔴 An error occurred while generating feedback: {e}")
                 st.session_state.feedback_generated = True
 
-    else:
-        # Display existing feedback
-        for msg in st.session_state.feedback_messages:
-            with st.chat_message(msg["role"]):
-                st.markdown(msg["content"])
-
-    st.markdown("---")
-    if st.button("Restart Interview", type="secondary"):
-        st.session_state.clear()
-        st.rerun()
\ No newline at end of file
+        else:
+            # Display existing feedback
+            for msg in st.session_state.feedback_messages:
+                with st.chat_message(msg["role"]):
+                    st.markdown(msg["content"])